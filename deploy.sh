@@ -123,8 +123,12 @@ pm2 delete yttmp3-api 2>/dev/null || true
 # Start Next.js frontend
 pm2 start npm --name "yttmp3-web" -- start
 
+# Stage converted files on tmpfs and let nginx send them (see /protected/ in nginx.conf)
+export YTTMP3_TEMP_DIR=/dev/shm/yttmp3
+export YTTMP3_ACCEL_REDIRECT=/protected/
+
 # Start Flask API with correct paths
-pm2 start "${VENV_PATH}/bin/gunicorn" --name "yttmp3-api" --cwd "${SERVER_PATH}" -- -w 2 -b 0.0.0.0:5000 app:app
+pm2 start "${VENV_PATH}/bin/gunicorn" --name "yttmp3-api" --cwd "${SERVER_PATH}" -- -k gthread -w 4 --threads 16 -b 0.0.0.0:5000 wsgi:app
 
 pm2 save
 
@@ -4,18 +4,32 @@ Production-ready signature-based YouTube converter API
 Implements competitor-style request signing and advanced evasion
 """
 
+import io
 import os
-import json
+import re
+import shutil
+import atexit
+import threading
 import tempfile
 import subprocess
 import hashlib
-import hmac
-import base64
 import time
 import random
+import queue
+import uuid
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import lru_cache
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
+from urllib.parse import quote
+import orjson
+import yt_dlp
+from cachetools import TTLCache
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.datastructures import Headers
+from signing import RequestSigner
 from datetime import datetime
 import logging
 
@@ -23,24 +37,178 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app, origins=[
+CORS_ORIGINS = (
     "http://localhost:3000",
     "https://yttmp3.com",
-    "https://www.yttmp3.com"
-])
+    "https://www.yttmp3.com",
+)
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify and request.get_json"""
+    
+    option = orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping a decode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.option),
+            mimetype='application/json'
+        )
+
+app = Flask(__name__)
+app.json = OrjsonProvider(app)
+CORS(app, origins=list(CORS_ORIGINS))
 
 # Configuration
-TEMP_DIR = tempfile.mkdtemp(prefix="yttmp3_")
+SHM_DIR = '/dev/shm'  # RAM-backed tmpfs, when available
+# A fixed TEMP_DIR is needed when nginx serves converted files from it
+PINNED_TEMP_DIR = os.environ.get('YTTMP3_TEMP_DIR')
+if PINNED_TEMP_DIR:
+    TEMP_DIR = PINNED_TEMP_DIR
+    os.makedirs(TEMP_DIR, mode=0o755, exist_ok=True)
+else:
+    TEMP_DIR = tempfile.mkdtemp(
+        prefix="yttmp3_",
+        dir=SHM_DIR if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK) else None
+    )
+# Internal nginx location that maps to TEMP_DIR, e.g. /protected/
+ACCEL_REDIRECT_PREFIX = os.environ.get('YTTMP3_ACCEL_REDIRECT')
+TEMP_FILE_TTL = int(os.environ.get('YTTMP3_TEMP_TTL', 600))  # seconds
+TEMP_CLEANUP_INTERVAL = 60  # seconds
 MAX_FILESIZE = 500 * 1024 * 1024  # 500MB
+VIDEO_INFO_CACHE_SIZE = int(os.environ.get('YTTMP3_INFO_CACHE_SIZE', 2048))
+VIDEO_INFO_CACHE_TTL = int(os.environ.get('YTTMP3_INFO_CACHE_TTL', 600))  # seconds
+# Overall deadline for one in-process extraction; socket_timeout only bounds single reads
+YTDLP_INFO_TIMEOUT = 120  # seconds
+YTDLP_INFO_WORKERS = 32  # threads running extractions, including any stuck past the deadline
+VIDEO_INFO_WAIT_TIMEOUT = YTDLP_INFO_TIMEOUT + 5  # seconds a duplicate request waits on an in-flight fetch
 COOKIES_FILE = Path(__file__).parent.parent / "cookies.txt"
+COOKIES_CHECK_INTERVAL = 30  # seconds
 SECRET_KEY = os.environ.get('YTTMP3_SECRET', 'yttmp3_production_key_2024')
+YTDLP_USER_AGENT = 'Mozilla/5.0 (Android 11; Mobile; rv:94.0) Gecko/94.0 Firefox/94.0'
+STREAM_CHUNK_SIZE = 64 * 1024  # 64KB
+# Opt-in random delay before hitting YouTube; off by default since it only idles the worker
+ANTIBOT_SLEEP = os.environ.get('YTTMP3_ANTIBOT_SLEEP', 'False').lower() == 'true'
+# Converted files up to this size stay in RAM; larger ones spill to TEMP_DIR
+TMP_MAX_MEM = int(os.environ.get('TMP_MAX_MEM_BYTES', 16 << 20))
+# Matches watch?v=, youtu.be/, embed/ and shorts/ URLs: every path form ends in
+# "/<id>", so a single alternation covers what used to be four patterns
+VIDEO_ID_RE = re.compile(r'(?:v=|/)([0-9A-Za-z_-]{11})')
+# Longer input is rejected before matching; real YouTube URLs are far shorter
+MAX_URL_LENGTH = 2048
+# Output format -> (yt-dlp format selector, mimetype). MP3 is re-encoded by
+# ffmpeg; m4a is YouTube's own AAC stream served as-is, with no re-encode.
+# m4a has no fallback: any other stream would be mislabeled as audio/mp4,
+# so videos without one get a 422 (FormatUnavailableError) instead.
+AUDIO_FORMATS = {
+    'mp3': ('bestaudio[ext=m4a]/bestaudio/best', 'audio/mpeg'),
+    'm4a': ('bestaudio[ext=m4a]', 'audio/mp4'),
+}
+# Anything but letters, digits, spaces, hyphens and underscores is stripped from titles
+SAFE_TITLE_RE = re.compile(r'[^\w \-]')
+# Background conversions (per process); excess submissions get a 503
+JOB_WORKERS = int(os.environ.get('YTTMP3_WORKERS', 8))
+JOB_QUEUE_LIMIT = int(os.environ.get('YTTMP3_JOB_QUEUE', JOB_WORKERS * 4))
+JOB_RETRY_AFTER = 10  # seconds
+JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+# TEMP_DIR may be RAM, so the janitor also evicts the oldest finished files
+# beyond this. It bounds the whole directory, which every worker shares when
+# pinned, so it is a per-host budget and each worker's janitor enforces the same total.
+TEMP_DIR_MAX_BYTES = int(os.environ.get(
+    'YTTMP3_TEMP_MAX_BYTES',
+    shutil.disk_usage(TEMP_DIR).total // 2
+))
+# Finished outputs: job audio ({job_id}.{fmt}) and nginx files ({etag}.{fmt}).
+# Everything else is still being written or is job state, and is left to the TTL.
+FINISHED_AUDIO_RE = re.compile(r'[0-9a-f]{32}(?:[0-9a-f]{8})?\.(?:%s)' % '|'.join(AUDIO_FORMATS))
+
+def start_periodic_task(func, interval):
+    """Run func every interval seconds on a daemon thread"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"Periodic task {func.__name__} failed: {str(e)}")
+    
+    thread = threading.Thread(target=run, name=func.__name__, daemon=True)
+    thread.start()
+    return thread
+
+def cleanup_temp_files():
+    """Remove staged files older than TEMP_FILE_TTL so tmpfs can't fill up
+    
+    If what remains still exceeds TEMP_DIR_MAX_BYTES, the oldest finished
+    outputs are evicted until it fits. Files still being written are never
+    evicted: the writer keeps them open, so unlinking frees no RAM and only
+    breaks the later rename.
+    """
+    cutoff = time.time() - TEMP_FILE_TTL
+    remaining = []
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    logger.info(f"Removed stale temp file: {entry.name}")
+                else:
+                    remaining.append((stat.st_mtime, stat.st_size, entry.name))
+            except FileNotFoundError:
+                pass
+    
+    total_size = sum(size for _, size, _ in remaining)
+    if total_size <= TEMP_DIR_MAX_BYTES:
+        return
+    
+    remaining.sort()
+    for _, size, name in remaining:
+        if not FINISHED_AUDIO_RE.fullmatch(name):
+            continue
+        try:
+            os.remove(os.path.join(TEMP_DIR, name))
+            logger.warning(f"Evicted temp file over size budget: {name}")
+        except FileNotFoundError:
+            pass
+        total_size -= size
+        if total_size <= TEMP_DIR_MAX_BYTES:
+            break
+
+start_periodic_task(cleanup_temp_files, TEMP_CLEANUP_INTERVAL)
+# TEMP_DIR may live in RAM, so don't leave it behind on shutdown. A pinned
+# directory is shared by every worker and is left to the janitor instead.
+if not PINNED_TEMP_DIR:
+    atexit.register(shutil.rmtree, TEMP_DIR, ignore_errors=True)
 
 # Rate limiting
-from collections import defaultdict
-request_counts = defaultdict(list)
+from collections import defaultdict, deque
 RATE_LIMIT = 15  # requests per minute per IP
 RATE_WINDOW = 60  # seconds
+RATE_SWEEP_INTERVAL = 60  # seconds
+RATE_IDLE_TIMEOUT = RATE_WINDOW * 2  # seconds without requests before an IP is forgotten
+# Only the last RATE_LIMIT timestamps matter, so a bounded deque per IP is enough
+request_counts = defaultdict(lambda: deque(maxlen=RATE_LIMIT))
+request_counts_lock = threading.Lock()
+
+def sweep_request_counts():
+    """Forget IPs that have been idle for RATE_IDLE_TIMEOUT"""
+    cutoff = time.time() - RATE_IDLE_TIMEOUT
+    with request_counts_lock:
+        for client_ip, timestamps in list(request_counts.items()):
+            if not timestamps or timestamps[-1] < cutoff:
+                del request_counts[client_ip]
+
+start_periodic_task(sweep_request_counts, RATE_SWEEP_INTERVAL)
 
 def rate_limit(f):
     """Rate limiting decorator"""
@@ -51,25 +219,23 @@ def rate_limit(f):
         client_ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
         current_time = time.time()
         
-        # Clean old requests
-        request_counts[client_ip] = [
-            req_time for req_time in request_counts[client_ip]
-            if current_time - req_time < RATE_WINDOW
-        ]
+        with request_counts_lock:
+            timestamps = request_counts[client_ip]
+            
+            # Check rate limit against the oldest request still tracked
+            if len(timestamps) == RATE_LIMIT and current_time - timestamps[0] < RATE_WINDOW:
+                retry_after = int(RATE_WINDOW - (current_time - timestamps[0])) + 1
+            else:
+                retry_after = None
+                # Add current request
+                timestamps.append(current_time)
         
-        # Check rate limit
-        if len(request_counts[client_ip]) >= RATE_LIMIT:
+        if retry_after is not None:
             logger.warning(f"Rate limit exceeded for IP: {client_ip}")
             return jsonify({
                 'error': 'Too many requests. Please wait a moment and try again.',
-                'retry_after': 60
-            }), 429
-        
-        # Add current request
-        request_counts[client_ip].append(current_time)
-        
-        # Add random delay
-        time.sleep(random.uniform(0.1, 0.3))
+                'retry_after': retry_after
+            }), 429, {'Retry-After': str(retry_after)}
         
         return f(*args, **kwargs)
     return decorated_function
@@ -78,7 +244,7 @@ class SignatureManager:
     """Manages request signatures like competitor"""
     
     def __init__(self, secret_key):
-        self.secret_key = secret_key.encode()
+        self.signer = RequestSigner(secret_key)
     
     def generate_signature(self, video_id, format_type="mp3", timestamp=None):
         """Generate encrypted signature"""
@@ -87,18 +253,8 @@ class SignatureManager:
         
         random_val = random.random()
         
-        # Create signature string (similar to competitor)
-        sig_data = f"{video_id}|{format_type}|{timestamp}|{random_val}"
-        
-        # Generate HMAC-SHA256 signature
-        signature = hmac.new(
-            self.secret_key,
-            sig_data.encode(),
-            hashlib.sha256
-        ).digest()
-        
-        # Base64 encode like competitor
-        encoded_sig = base64.b64encode(signature).decode()
+        # Generate keyed BLAKE2b signature
+        encoded_sig = self.signer.sign(video_id, format_type, timestamp, random_val)
         
         return {
             'sig': encoded_sig,
@@ -110,107 +266,450 @@ class SignatureManager:
     
     def verify_signature(self, sig_data):
         """Verify signature"""
+        if not isinstance(sig_data, dict):
+            return False
         try:
-            sig_string = f"{sig_data['v']}|{sig_data['f']}|{sig_data['t']}|{sig_data['_']}"
-            expected_sig = hmac.new(
-                self.secret_key,
-                sig_string.encode(),
-                hashlib.sha256
-            ).digest()
-            expected_encoded = base64.b64encode(expected_sig).decode()
-            return hmac.compare_digest(sig_data['sig'], expected_encoded)
-        except:
+            return self.signer.verify(
+                sig_data['sig'], sig_data['v'], sig_data['f'], sig_data['t'], sig_data['_']
+            )
+        except KeyError:
             return False
 
 # Global signature manager
 sig_manager = SignatureManager(SECRET_KEY)
 
+# Formatted video metadata keyed by video ID
+video_info_cache = TTLCache(maxsize=VIDEO_INFO_CACHE_SIZE, ttl=VIDEO_INFO_CACHE_TTL)
+video_info_lock = threading.Lock()
+# Fetches in progress, so concurrent requests for one video share a single extraction
+video_info_inflight = {}
+
 def extract_video_id(url):
     """Extract video ID from YouTube URL"""
-    import re
-    
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed\/)([0-9A-Za-z_-]{11})',
-        r'(?:watch\?v=)([0-9A-Za-z_-]{11})',
-        r'(?:shorts\/)([0-9A-Za-z_-]{11})',
-    ]
+    if len(url) > MAX_URL_LENGTH:
+        raise ValueError("URL is too long")
     
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = VIDEO_ID_RE.search(url)
+    if match:
+        return match.group(1)
     
     raise ValueError(f"Could not extract video ID from URL: {url}")
 
-def run_ytdlp_with_signature(video_id, action="info", output_path=None):
-    """Run yt-dlp with signature-based configuration"""
+# Last cookies file check, refreshed at most every COOKIES_CHECK_INTERVAL
+cookies_state = {'checked_at': 0, 'path': None, 'mtime': None}
+
+def cookies_file_path():
+    """Get the cookies file path if a usable one is present
     
-    # Generate signature for this request
-    sig_data = sig_manager.generate_signature(video_id)
+    The stat() result is cached for COOKIES_CHECK_INTERVAL seconds so the
+    request path doesn't hit the filesystem every time.
+    """
+    now = time.time()
+    if now - cookies_state['checked_at'] > COOKIES_CHECK_INTERVAL:
+        try:
+            stat = COOKIES_FILE.stat()
+            cookies_state.update(
+                path=str(COOKIES_FILE) if stat.st_size > 100 else None,
+                mtime=stat.st_mtime,
+                checked_at=now
+            )
+        except FileNotFoundError:
+            cookies_state.update(path=None, mtime=None, checked_at=now)
     
-    # Advanced yt-dlp command with multiple fallbacks
-    cmd_base = [
-        'yt-dlp',
-        '--quiet',
-        '--no-warnings',
-        '--extract-flat' if action == 'info' else '--no-extract-flat',
-        '--user-agent', 'Mozilla/5.0 (Android 11; Mobile; rv:94.0) Gecko/94.0 Firefox/94.0',
+    return cookies_state['path']
+
+def ytdlp_common_args():
+    """Get yt-dlp CLI flags shared by every invocation"""
+    args = [
+        '--user-agent', YTDLP_USER_AGENT,
         '--referer', 'https://www.youtube.com/',
     ]
     
     # Add cookies if available
-    if COOKIES_FILE.exists() and COOKIES_FILE.stat().st_size > 100:
-        cmd_base.extend(['--cookies', str(COOKIES_FILE)])
-    
-    # Configure for different actions
-    if action == "info":
-        cmd_base.extend([
-            '--dump-json',
-            '--no-download',
-        ])
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        cmd = cmd_base + [url]
-    
-    elif action == "download":
-        cmd_base.extend([
-            '--extract-audio',
-            '--audio-format', 'mp3',
-            '--audio-quality', '320K',
-            '--output', output_path,
-            '--format', 'bestaudio[ext=m4a]/bestaudio/best',
-        ])
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        cmd = cmd_base + [url]
+    cookiefile = cookies_file_path()
+    if cookiefile:
+        args.extend(['--cookies', cookiefile])
     
-    else:
+    return args
+
+def ytdlp_options(cookiefile=None):
+    """Get in-process yt-dlp options matching the CLI flags above"""
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        # Both endpoints take single videos, and flat extraction would leave
+        # out the duration, thumbnails and uploader fields fetch_video_info reads
+        'extract_flat': False,
+        'skip_download': True,
+        'socket_timeout': 30,
+        'http_headers': {
+            'User-Agent': YTDLP_USER_AGENT,
+            'Referer': 'https://www.youtube.com/',
+        },
+    }
+    if cookiefile:
+        opts['cookiefile'] = cookiefile
+    return opts
+
+@lru_cache(maxsize=8)
+def ytdlp_pool(cookiefile=None, cookies_mtime=None):
+    """Get the pool of idle YoutubeDL instances for one option set
+    
+    YoutubeDL isn't safe to share between concurrent extractions, so each
+    request checks an instance out and returns it when done; new instances
+    are only built when every pooled one is busy. cookies_mtime is only part
+    of the cache key: instances load cookies once, so an updated cookies
+    file gets a fresh pool.
+    """
+    return queue.SimpleQueue()
+
+# Extractions run here so the request thread can stop waiting at the deadline
+info_executor = ThreadPoolExecutor(max_workers=YTDLP_INFO_WORKERS, thread_name_prefix='extract')
+
+def run_ytdlp_with_signature(video_id, action="info"):
+    """Run an in-process yt-dlp extraction against the deadline
+    
+    Only metadata extraction goes through here; audio is produced by
+    stream_ytdlp_audio. Returns the sanitized info dict.
+    """
+    
+    if action != "info":
         raise ValueError(f"Invalid action: {action}")
     
-    logger.info(f"Running yt-dlp with signature {sig_data['sig'][:20]}... for video {video_id}")
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    cookiefile = cookies_file_path()
+    pool = ytdlp_pool(cookiefile, cookies_state['mtime'])
+    
+    logger.info(f"Running yt-dlp for video {video_id}")
+    
+    if ANTIBOT_SLEEP:
+        time.sleep(random.uniform(0.2, 0.8))
+    
+    try:
+        ydl = pool.get_nowait()
+    except queue.Empty:
+        ydl = yt_dlp.YoutubeDL(ytdlp_options(cookiefile))
+    
+    future = info_executor.submit(ydl.extract_info, url, download=False)
+    try:
+        info = future.result(timeout=YTDLP_INFO_TIMEOUT)
+    except FuturesTimeoutError:
+        if future.cancel():
+            # Still queued behind busy workers, so the instance was never used
+            pool.put(ydl)
+        # Otherwise the call can't be interrupted and still owns this
+        # instance, so it is dropped rather than handed to the next request
+        logger.error(f"yt-dlp timed out after {YTDLP_INFO_TIMEOUT}s for video {video_id}")
+        raise TimeoutError(f"Extraction timed out after {YTDLP_INFO_TIMEOUT}s")
+    except Exception as e:
+        pool.put(ydl)
+        logger.error(f"yt-dlp failed: {str(e)}")
+        raise Exception(f"Extraction failed: {str(e)}")
+    
+    pool.put(ydl)
+    return ydl.sanitize_info(info)
+
+class FileTooLargeError(Exception):
+    """Raised when converted audio grows past MAX_FILESIZE"""
+
+class ConversionError(Exception):
+    """Raised when yt-dlp or ffmpeg exits with an error"""
+    status_code = 502
+
+class FormatUnavailableError(ConversionError):
+    """Raised when the video has no stream matching the requested format"""
+    status_code = 422
+
+def read_stderr(stderr_file):
+    """Read a subprocess's captured stderr"""
+    stderr_file.seek(0)
+    return stderr_file.read().decode(errors='replace').strip()
+
+def stream_ytdlp_audio(video_id, format_type="mp3"):
+    """Stream audio by piping yt-dlp's audio output through ffmpeg
+    
+    Yields encoded chunks as soon as ffmpeg produces them; nothing is staged
+    in TEMP_DIR. For m4a, yt-dlp's output is passed through without ffmpeg.
+    The subprocesses are killed when the generator is closed, e.g. on client
+    disconnect. Raises FileTooLargeError once MAX_FILESIZE is exceeded, and
+    ConversionError at EOF if either process failed, since a yt-dlp error
+    mid-download otherwise just looks like a short file to ffmpeg.
+    """
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    ytdlp_cmd = [
+        'yt-dlp',
+        '--quiet',
+        '--no-warnings',
+        '--no-extract-flat',
+    ] + ytdlp_common_args() + [
+        '--format', AUDIO_FORMATS[format_type][0],
+        '--output', '-',
+        url,
+    ]
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-vn',
+        '-f', 'mp3',
+        '-b:a', '320k',
+        'pipe:1',
+    ]
     
-    # Add random delay
-    time.sleep(random.uniform(0.2, 0.8))
+    logger.info(f"Streaming audio for video {video_id}")
     
+    # stderr goes to unlinked temp files rather than pipes, so a chatty
+    # process can't block on a full pipe while we only read stdout
+    ytdlp_stderr = tempfile.TemporaryFile(dir=TEMP_DIR)
     try:
-        # Run command with timeout
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=120,
+        ytdlp = subprocess.Popen(
+            ytdlp_cmd,
+            stdout=subprocess.PIPE,
+            stderr=ytdlp_stderr,
             cwd=TEMP_DIR
         )
+    except BaseException:
+        ytdlp_stderr.close()
+        raise
+    # yt-dlp first: when it fails, ffmpeg's error is only a symptom
+    procs = [('yt-dlp', ytdlp, ytdlp_stderr)]
+    audio_out = ytdlp.stdout
+    
+    # Everything after the first spawn is covered, so a failure to start
+    # ffmpeg still kills yt-dlp instead of leaving it blocked on its pipe
+    try:
+        if format_type == 'mp3':
+            ffmpeg_stderr = tempfile.TemporaryFile(dir=TEMP_DIR)
+            try:
+                ffmpeg = subprocess.Popen(
+                    ffmpeg_cmd,
+                    stdin=ytdlp.stdout,
+                    stdout=subprocess.PIPE,
+                    stderr=ffmpeg_stderr,
+                    bufsize=1 << 20
+                )
+            except BaseException:
+                ffmpeg_stderr.close()
+                raise
+            # Let yt-dlp receive SIGPIPE if ffmpeg exits early
+            ytdlp.stdout.close()
+            procs.append(('ffmpeg', ffmpeg, ffmpeg_stderr))
+            audio_out = ffmpeg.stdout
         
-        if result.returncode != 0:
-            logger.error(f"yt-dlp failed: {result.stderr}")
-            raise Exception(f"yt-dlp error: {result.stderr}")
+        bytes_sent = 0
+        while True:
+            chunk = audio_out.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            
+            bytes_sent += len(chunk)
+            if bytes_sent > MAX_FILESIZE:
+                raise FileTooLargeError(f"Stream for {video_id} exceeded {MAX_FILESIZE} bytes")
+            
+            yield chunk
         
-        return result.stdout, sig_data
+        for name, proc, stderr_file in procs:
+            if proc.wait() != 0:
+                stderr = read_stderr(stderr_file)
+                logger.error(f"{name} failed for {video_id}: {stderr}")
+                if 'Requested format is not available' in stderr:
+                    raise FormatUnavailableError(f"No {format_type} audio stream is available for this video")
+                raise ConversionError(f"{name} error: {stderr.splitlines()[-1] if stderr else proc.returncode}")
+    finally:
+        for _, proc, stderr_file in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            stderr_file.close()
+        audio_out.close()
+
+def discard_audio_file(audio):
+    """Close a staging file and remove it from disk if it has a path"""
+    audio.close()
+    if isinstance(audio.name, str) and os.path.exists(audio.name):
+        os.remove(audio.name)
+
+def attachment_headers(filename):
+    """Build a Content-Disposition header for a downloaded file
+    
+    Matches send_file: non-ASCII names get an RFC 5987 filename* plus an
+    ASCII-normalised filename for clients that don't understand it.
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename)
+        simple = simple.encode('ascii', 'ignore').decode('ascii')
+        # safe = RFC 5987 attr-char
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        names = {'filename': simple, 'filename*': f"UTF-8''{quoted}"}
+    else:
+        names = {'filename': filename}
     
-    except subprocess.TimeoutExpired:
-        raise Exception("Request timeout - video may be too long or unavailable")
+    headers = Headers()
+    headers.set('Content-Disposition', 'attachment', **names)
+    return {'Content-Disposition': headers['Content-Disposition']}
+
+def convert_into(video_id, format_type, audio):
+    """Write converted audio into an open file, returning (size, content digest)
+    
+    Raises whatever stream_ytdlp_audio raises; callers discard the file then.
+    """
+    digest = hashlib.sha1()
+    for chunk in stream_ytdlp_audio(video_id, format_type):
+        audio.write(chunk)
+        digest.update(chunk)
+    return audio.tell(), digest.hexdigest()
+
+def staged_file_response(path, download_name, format_type, etag):
+    """Serve a converted file from TEMP_DIR, through nginx when configured"""
+    mimetype = AUDIO_FORMATS[format_type][1]
+    if ACCEL_REDIRECT_PREFIX:
+        # Hand the transfer to nginx
+        return Response(
+            mimetype=mimetype,
+            headers={
+                **attachment_headers(download_name),
+                'X-Accel-Redirect': ACCEL_REDIRECT_PREFIX + os.path.basename(path),
+            }
+        )
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag
+    )
+
+def streaming_audio_response(video_id, format_type, download_name):
+    """Stream audio to the client as it is converted
+    
+    The first chunk is read up front so failures still surface as a JSON
+    error instead of an empty attachment.
+    """
+    chunks = stream_ytdlp_audio(video_id, format_type)
+    try:
+        first_chunk = next(chunks, b'')
+    except FileTooLargeError:
+        return jsonify({'error': 'File too large'}), 413
+    except ConversionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if not first_chunk:
+        return jsonify({'error': 'Conversion failed'}), 500
+    
+    def generate():
+        yield first_chunk
+        # A ConversionError past this point propagates: headers are already
+        # sent, so dropping the connection is the only way to flag truncation
+        try:
+            yield from chunks
+        except FileTooLargeError as e:
+            logger.warning(f"{str(e)}, aborting")
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=AUDIO_FORMATS[format_type][1],
+        headers=attachment_headers(download_name)
+    )
+
+# Background conversion jobs. Job state lives in TEMP_DIR rather than in
+# memory so any worker can answer a poll, and the janitor expires it with
+# the audio. An unpinned TEMP_DIR is private to its process, so running
+# several gunicorn workers requires YTTMP3_TEMP_DIR (start.sh and deploy.sh
+# both set it).
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='convert')
+job_slots = threading.BoundedSemaphore(JOB_QUEUE_LIMIT)
+# (video_id, format) -> job_id of queued or running jobs in this process
+jobs_inflight = {}
+jobs_inflight_lock = threading.Lock()
+
+def job_path(job_id, suffix):
+    """Path of a job's state or audio file in TEMP_DIR"""
+    return os.path.join(TEMP_DIR, f"{job_id}.{suffix}")
+
+def write_job_state(job_id, **state):
+    """Atomically replace a job's state file"""
+    tmp_path = job_path(job_id, 'job.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(state))
+    os.replace(tmp_path, job_path(job_id, 'job'))
+
+def run_convert_job(job_id, video_id, format_type):
+    """Convert on a pool thread and publish the result under job_id"""
+    audio = tempfile.NamedTemporaryFile(dir=TEMP_DIR, suffix=f".{format_type}", delete=False)
+    os.chmod(audio.name, 0o644)
+    try:
+        file_size, etag = convert_into(video_id, format_type, audio)
+        if not file_size:
+            discard_audio_file(audio)
+            write_job_state(job_id, status='error', error='Conversion failed', code=500)
+            return
+        
+        audio.close()
+        os.replace(audio.name, job_path(job_id, format_type))
+        write_job_state(job_id, status='done', v=video_id, f=format_type, etag=etag)
+        logger.info(f"Job {job_id} converted {video_id} to {format_type.upper()} ({file_size} bytes)")
+    except FileTooLargeError:
+        discard_audio_file(audio)
+        write_job_state(job_id, status='error', error='File too large', code=413)
+    except ConversionError as e:
+        discard_audio_file(audio)
+        write_job_state(job_id, status='error', error=str(e), code=e.status_code)
     except Exception as e:
-        raise Exception(f"Extraction failed: {str(e)}")
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        discard_audio_file(audio)
+        write_job_state(job_id, status='error', error=str(e), code=500)
+    finally:
+        with jobs_inflight_lock:
+            jobs_inflight.pop((video_id, format_type), None)
+        job_slots.release()
+
+def touch_inflight_jobs():
+    """Refresh the state files of this process's queued and running jobs
+    
+    The janitor expires files by mtime and a pending state file is written
+    only once, so a job queued or running past TEMP_FILE_TTL would otherwise
+    disappear from /api/job while still alive.
+    """
+    with jobs_inflight_lock:
+        job_ids = list(jobs_inflight.values())
+    for job_id in job_ids:
+        try:
+            os.utime(job_path(job_id, 'job'))
+        except FileNotFoundError:
+            pass
+
+start_periodic_task(touch_inflight_jobs, TEMP_CLEANUP_INTERVAL)
+
+def submit_convert_job(video_id, format_type):
+    """Queue a conversion, refusing new work once the queue is full"""
+    key = (video_id, format_type)
+    with jobs_inflight_lock:
+        # Only one job per video and format; duplicates get the running job's ID
+        job_id = jobs_inflight.get(key)
+        if job_id:
+            return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+        if job_slots.acquire(blocking=False):
+            job_id = jobs_inflight[key] = uuid.uuid4().hex
+    
+    if job_id is None:
+        logger.warning(f"Job queue full, rejecting {video_id}")
+        return jsonify({
+            'error': 'Server busy. Please try again shortly.',
+            'retry_after': JOB_RETRY_AFTER
+        }), 503, {'Retry-After': str(JOB_RETRY_AFTER)}
+    
+    try:
+        write_job_state(job_id, status='pending')
+        job_executor.submit(run_convert_job, job_id, video_id, format_type)
+    except Exception:
+        with jobs_inflight_lock:
+            jobs_inflight.pop(key, None)
+        job_slots.release()
+        raise
+    
+    return jsonify({'job_id': job_id, 'status': 'pending'}), 202
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -233,6 +732,8 @@ def convert_with_signature():
             format_type = request.args.get('f', 'mp3')
             timestamp = request.args.get('t')
             random_val = request.args.get('_')
+            stream = request.args.get('stream', '').lower() in ('1', 'true')
+            run_async = request.args.get('async', '').lower() in ('1', 'true')
         else:
             data = request.get_json()
             sig = data.get('sig')
@@ -240,10 +741,15 @@ def convert_with_signature():
             format_type = data.get('f', 'mp3')
             timestamp = data.get('t')
             random_val = data.get('_')
+            stream = bool(data.get('stream'))
+            run_async = bool(data.get('async'))
         
         if not all([sig, video_id, timestamp, random_val]):
             return jsonify({'error': 'Missing required signature parameters'}), 400
         
+        if format_type not in AUDIO_FORMATS:
+            return jsonify({'error': f'Unsupported format: {format_type}'}), 400
+        
         # Verify signature
         sig_data = {
             'sig': sig,
@@ -262,43 +768,163 @@ def convert_with_signature():
         
         logger.info(f"Converting video {video_id} with valid signature")
         
-        # Generate safe filename
-        safe_title = f"yttmp3_{video_id}"
-        output_pattern = os.path.join(TEMP_DIR, f"{safe_title}.%(ext)s")
+        # Streaming trades Content-Length/ETag for a faster first byte
+        if stream:
+            return streaming_audio_response(video_id, format_type, f"{video_id}.{format_type}")
         
-        # Download and convert
-        output, sig_info = run_ytdlp_with_signature(video_id, "download", output_pattern)
+        # Convert in the background and let the client poll /api/job/<id>
+        if run_async:
+            return submit_convert_job(video_id, format_type)
         
-        # Find the converted file
-        mp3_file = None
-        for file in os.listdir(TEMP_DIR):
-            if file.startswith(safe_title) and file.endswith('.mp3'):
-                mp3_file = os.path.join(TEMP_DIR, file)
-                break
+        if ACCEL_REDIRECT_PREFIX:
+            # nginx sends the file itself, so it needs a named file it can read
+            audio = tempfile.NamedTemporaryFile(dir=TEMP_DIR, suffix=f".{format_type}", delete=False)
+            os.chmod(audio.name, 0o644)
+        else:
+            # Small files never leave RAM; larger ones roll over to TEMP_DIR
+            audio = tempfile.SpooledTemporaryFile(max_size=TMP_MAX_MEM, dir=TEMP_DIR)
+        # Content digest doubles as the ETag so retries can get a 304
+        try:
+            file_size, etag = convert_into(video_id, format_type, audio)
+        except FileTooLargeError:
+            discard_audio_file(audio)
+            return jsonify({'error': 'File too large'}), 413
+        except ConversionError as e:
+            discard_audio_file(audio)
+            return jsonify({'error': str(e)}), e.status_code
+        except Exception:
+            discard_audio_file(audio)
+            raise
         
-        if not mp3_file or not os.path.exists(mp3_file):
+        if not file_size:
+            discard_audio_file(audio)
             return jsonify({'error': 'Conversion failed'}), 500
         
-        # Check file size
-        file_size = os.path.getsize(mp3_file)
-        if file_size > MAX_FILESIZE:
-            os.remove(mp3_file)
-            return jsonify({'error': 'File too large'}), 413
+        logger.info(f"Successfully converted {video_id} to {format_type.upper()} ({file_size} bytes)")
         
-        logger.info(f"Successfully converted {video_id} to MP3 ({file_size} bytes)")
+        download_name = f"{video_id}.{format_type}"
         
-        # Return file
-        return send_file(
-            mp3_file,
+        if ACCEL_REDIRECT_PREFIX:
+            # Name the file after its content so repeat conversions replace one
+            # file instead of piling up; the janitor removes it later
+            audio.close()
+            audio_path = os.path.join(TEMP_DIR, f"{etag}.{format_type}")
+            os.replace(audio.name, audio_path)
+            return staged_file_response(audio_path, download_name, format_type, etag)
+        
+        # Return file. The ETag is a content digest, so a matching
+        # If-None-Match gets a 304, but only after the full download and
+        # re-encode: conditional requests save egress, not conversion. There
+        # is no stable Last-Modified for freshly converted bytes, so none is sent.
+        audio.seek(0)
+        if not audio._rolled:
+            # gunicorn probes fileno() for sendfile, which would roll the
+            # spool over to TEMP_DIR; send a view of the in-memory buffer
+            # instead (getvalue() and BytesIO share the bytes, no copy)
+            buffer = io.BytesIO(audio._file.getvalue())
+            audio.close()
+            audio = buffer
+        response = send_file(
+            audio,
             as_attachment=True,
-            download_name=f"{video_id}.mp3",
-            mimetype='audio/mpeg'
+            download_name=download_name,
+            mimetype=AUDIO_FORMATS[format_type][1],
+            conditional=True,
+            etag=etag
         )
+        if response.status_code == 200:
+            response.content_length = file_size
+        return response
     
     except Exception as e:
         logger.error(f"Conversion error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/job/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a conversion started with /api/v1/convert?async=1"""
+    if not JOB_ID_RE.fullmatch(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    try:
+        with open(job_path(job_id, 'job'), 'rb') as f:
+            state = orjson.loads(f.read())
+    except FileNotFoundError:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if state['status'] == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    if state['status'] == 'error':
+        return jsonify({'status': 'error', 'error': state['error']}), state['code']
+    
+    format_type = state['f']
+    audio_path = job_path(job_id, format_type)
+    if not os.path.exists(audio_path):
+        # Evicted by the janitor ahead of its state file
+        return jsonify({'error': 'Job expired'}), 404
+    
+    return staged_file_response(
+        audio_path,
+        f"{state['v']}.{format_type}",
+        format_type,
+        state['etag']
+    )
+
+def fetch_video_info(video_id):
+    """Extract and format video metadata (without a signature)"""
+    info = run_ytdlp_with_signature(video_id, "info")
+    
+    # Format response
+    duration = info.get('duration')
+    if duration:
+        minutes, seconds = divmod(int(duration), 60)
+        duration_str = f"{minutes}:{seconds:02d}"
+    else:
+        duration_str = "Unknown"
+    
+    thumbnails = info.get('thumbnails')
+    thumbnail_url = thumbnails[-1].get('url', '') if thumbnails else ''
+    
+    return {
+        'videoId': video_id,
+        'title': info.get('title', 'Unknown Title'),
+        'duration': duration_str,
+        'thumbnail': thumbnail_url,
+        'channel': info.get('uploader', 'Unknown Channel'),
+        'viewCount': info.get('view_count', 0),
+    }
+
+def get_cached_video_info(video_id):
+    """Video metadata from the cache, fetched at most once at a time per video"""
+    with video_info_lock:
+        video_info = video_info_cache.get(video_id)
+        if video_info is not None:
+            logger.info(f"Serving cached info for video: {video_id}")
+            return video_info
+        future = video_info_inflight.get(video_id)
+        is_leader = future is None
+        if is_leader:
+            future = video_info_inflight[video_id] = Future()
+    
+    if not is_leader:
+        logger.info(f"Waiting on in-flight info for video: {video_id}")
+        return future.result(timeout=VIDEO_INFO_WAIT_TIMEOUT)
+    
+    logger.info(f"Getting info for video: {video_id}")
+    try:
+        video_info = fetch_video_info(video_id)
+    except Exception as e:
+        with video_info_lock:
+            del video_info_inflight[video_id]
+        future.set_exception(e)
+        raise
+    
+    with video_info_lock:
+        video_info_cache[video_id] = video_info
+        del video_info_inflight[video_id]
+    future.set_result(video_info)
+    return video_info
+
 @app.route('/api/video-info', methods=['POST'])
 @rate_limit
 def get_video_info():
@@ -311,36 +937,27 @@ def get_video_info():
         url = data['url'].strip()
         video_id = extract_video_id(url)
         
-        logger.info(f"Getting info for video: {video_id}")
-        
-        # Get video info with signature
-        output, sig_data = run_ytdlp_with_signature(video_id, "info")
+        video_info = get_cached_video_info(video_id)
         
-        # Parse JSON output
-        info = json.loads(output)
-        
-        # Format response
-        duration = info.get('duration', 0)
-        if duration:
-            minutes, seconds = divmod(duration, 60)
-            duration_str = f"{int(minutes)}:{int(seconds):02d}"
-        else:
-            duration_str = "Unknown"
-        
-        thumbnails = info.get('thumbnails', [])
-        thumbnail_url = thumbnails[-1].get('url', '') if thumbnails else ''
-        
-        video_info = {
-            'videoId': video_id,
-            'title': info.get('title', 'Unknown Title'),
-            'duration': duration_str,
-            'thumbnail': thumbnail_url,
-            'channel': info.get('uploader', 'Unknown Channel'),
-            'viewCount': info.get('view_count', 0),
-            'signature': sig_data  # Include signature for next request
-        }
-        
-        return jsonify(video_info)
+        # Signatures carry a fresh timestamp, so they are never cached. Each one
+        # is bound to a format, so /api/v1/convert needs the one for its f=
+        return jsonify({
+            **video_info,
+            'signature': sig_manager.generate_signature(video_id),  # Include signature for next request
+            'signatures': {
+                format_type: sig_manager.generate_signature(video_id, format_type)
+                for format_type in AUDIO_FORMATS
+            }
+        })
+    
+    except (TimeoutError, FuturesTimeoutError):
+        # Raised by the extraction deadline, or while waiting on another
+        # request's in-flight fetch of the same video
+        logger.warning(f"Video info timed out for: {video_id}")
+        return jsonify({
+            'error': 'Timed out fetching video info. Please try again shortly.',
+            'retry_after': JOB_RETRY_AFTER
+        }), 504, {'Retry-After': str(JOB_RETRY_AFTER)}
     
     except Exception as e:
         logger.error(f"Video info error: {str(e)}")
@@ -357,8 +974,12 @@ def download_video():
         
         url = data['url'].strip()
         title = data.get('title', 'audio')
+        format_type = data.get('format', 'mp3')
         sig_data = data.get('signature')
         
+        if format_type not in AUDIO_FORMATS:
+            return jsonify({'error': f'Unsupported format: {format_type}'}), 400
+        
         # If signature provided, use it; otherwise generate new one
         if sig_data and sig_manager.verify_signature(sig_data):
             video_id = sig_data['v']
@@ -369,37 +990,10 @@ def download_video():
         logger.info(f"Downloading video: {video_id}")
         
         # Clean filename
-        safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+        safe_title = SAFE_TITLE_RE.sub('', title).strip()
         safe_title = safe_title[:50] if safe_title else f"yttmp3_{video_id}"
         
-        output_pattern = os.path.join(TEMP_DIR, f"{safe_title}.%(ext)s")
-        
-        # Download with signature
-        output, sig_info = run_ytdlp_with_signature(video_id, "download", output_pattern)
-        
-        # Find converted file
-        mp3_file = None
-        for file in os.listdir(TEMP_DIR):
-            if file.startswith(safe_title) and file.endswith('.mp3'):
-                mp3_file = os.path.join(TEMP_DIR, file)
-                break
-        
-        if not mp3_file or not os.path.exists(mp3_file):
-            return jsonify({'error': 'Conversion failed'}), 500
-        
-        file_size = os.path.getsize(mp3_file)
-        if file_size > MAX_FILESIZE:
-            os.remove(mp3_file)
-            return jsonify({'error': 'File too large'}), 413
-        
-        logger.info(f"Download complete: {safe_title}.mp3 ({file_size} bytes)")
-        
-        return send_file(
-            mp3_file,
-            as_attachment=True,
-            download_name=f"{safe_title}.mp3",
-            mimetype='audio/mpeg'
-        )
+        return streaming_audio_response(video_id, format_type, f"{safe_title}.{format_type}")
     
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
@@ -434,5 +1028,6 @@ if __name__ == '__main__':
     port = int(os.environ.get('FLASK_PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
+    # Development fallback only; production runs gunicorn against wsgi:app
     logger.info(f"Starting YTTMP3 Production API on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
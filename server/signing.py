@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Request signing shared by the API and the extractor
+"""
+
+import base64
+import hashlib
+import hmac
+import math
+
+def signature_number(value):
+    """Canonical bytes for a signed timestamp or random value
+    
+    Values may arrive as floats, ints or numeric strings (query strings,
+    clients that stringify numbers); all are rendered as the repr of the
+    float they denote, which is what the signature was generated over.
+    Anything else raises ValueError.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Signature value must be numeric, got {type(value).__name__}")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("Signature value must be finite")
+    return repr(number).encode('ascii')
+
+def signature_payload(video_id, format_type, timestamp, random_val):
+    """Signed bytes for a request"""
+    return b'|'.join((
+        video_id.encode('ascii'),
+        format_type.encode('ascii'),
+        signature_number(timestamp),
+        signature_number(random_val)
+    ))
+
+class RequestSigner:
+    """Keyed BLAKE2b signatures over request payloads"""
+    
+    def __init__(self, secret_key):
+        # BLAKE2b keys are capped at 64 bytes, so derive a fixed-size one;
+        # this also accepts secrets of any length and encoding
+        key = hashlib.sha256(secret_key.encode()).digest()
+        # Keyed hasher with the key block already absorbed; sign() copies it
+        self._hasher = hashlib.blake2b(key=key, digest_size=32)
+    
+    def sign(self, video_id, format_type, timestamp, random_val):
+        """Sign a request, returning unpadded base64url text"""
+        hasher = self._hasher.copy()
+        hasher.update(signature_payload(video_id, format_type, timestamp, random_val))
+        # Unpadded base64url so the signature needs no escaping in URLs
+        return base64.urlsafe_b64encode(hasher.digest()).rstrip(b'=').decode('ascii')
+    
+    def verify(self, sig, video_id, format_type, timestamp, random_val):
+        """Check a signature in constant time; malformed input never verifies"""
+        if not isinstance(sig, str):
+            return False
+        try:
+            expected = self.sign(video_id, format_type, timestamp, random_val)
+        except (ValueError, TypeError, AttributeError):
+            return False
+        return hmac.compare_digest(sig, expected)
@@ -68,8 +68,17 @@ fi
 export FLASK_ENV=production
 export FLASK_DEBUG=false
 export FLASK_PORT=${FLASK_PORT:-5000}
+# gunicorn runs several workers, and background jobs are only visible to
+# all of them when they share one staging directory
+if [ -z "$YTTMP3_TEMP_DIR" ]; then
+    if [ -d /dev/shm ] && [ -w /dev/shm ]; then
+        export YTTMP3_TEMP_DIR=/dev/shm/yttmp3
+    else
+        export YTTMP3_TEMP_DIR=/tmp/yttmp3
+    fi
+fi
 
 print_status "Starting Flask server on port $FLASK_PORT..."
 
-# Start the Flask server
-python3 app.py
\ No newline at end of file
+# Start the Flask server under gunicorn with threaded workers
+exec gunicorn -k gthread -w 4 --threads 16 -b 0.0.0.0:$FLASK_PORT wsgi:app
\ No newline at end of file
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for production
+
+Run with: gunicorn -k gthread -w 4 --threads 16 -b 0.0.0.0:5000 wsgi:app
+"""
+
+from app import app
+
+__all__ = ['app']
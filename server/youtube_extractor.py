@@ -4,41 +4,131 @@ Advanced YouTube extractor with signature-based anti-detection
 Similar to competitor's approach with encrypted signatures
 """
 
-import hashlib
-import hmac
-import base64
+import re
 import json
 import time
 import random
-import requests
+import threading
+import itertools
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from urllib.parse import urlencode, quote
 import yt_dlp
 from pathlib import Path
+from signing import RequestSigner
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Matches watch?v=, youtu.be/, embed/ and shorts/ URLs: every path form ends in
+# "/<id>", so a single alternation covers what used to be four patterns
+VIDEO_ID_RE = re.compile(r'(?:v=|/)([0-9A-Za-z_-]{11})')
+# Longer input is rejected before matching; real YouTube URLs are far shorter
+MAX_URL_LENGTH = 2048
+
+PARALLEL_STRATEGIES = 2  # strategies raced together before escalating to the next group
+STRATEGY_TIMEOUT = 120  # seconds
+STRATEGY_WORKERS = 16  # shared threads running strategies for every caller
+COOKIES_CHECK_INTERVAL = 30  # seconds between cookies file stat() calls
+
+# Rotate between multiple user agents
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) Gecko/20100101 Firefox/121.0'
+)
+
+# next() on a shared cycle isn't atomic across threads, hence the lock
+_user_agent_cycle = itertools.cycle(USER_AGENTS)
+_user_agent_lock = threading.Lock()
+
+def next_user_agent():
+    """Next browser User-Agent in the rotation"""
+    with _user_agent_lock:
+        return next(_user_agent_cycle)
+
+# Static yt-dlp option fragments, built once at import time
+BASE_HTTP_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'cross-site',
+    'Cache-Control': 'max-age=0',
+}
+
+# Advanced extractor arguments
+BASE_EXTRACTOR_ARGS = {
+    'youtube': {
+        'player_client': ['android', 'web'],
+        'player_skip': ['webpage', 'configs'],
+        'skip': ['hls', 'dash'],
+        'lang': ['en'],
+        'innertube_host': 'www.youtube.com',
+        'innertube_key': None,  # Let yt-dlp auto-detect
+    }
+}
+
+BASE_YTDLP_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'writeinfojson': False,
+    'writedescription': False,
+    'writesubtitles': False,
+    'writeautomaticsub': False,
+    'ignoreerrors': False,
+    'geo_bypass': True,
+    # Retry configuration
+    'retries': 3,
+    'fragment_retries': 3,
+    # yt-dlp randomizes between these bounds itself before each download
+    'sleep_interval': 0.5,
+    'max_sleep_interval': 10,
+    'sleep_interval_subtitles': 1,
+    # Network configuration
+    'socket_timeout': 30,
+    'http_chunk_size': 10485760,
+}
+
+MP3_POSTPROCESSORS = (
+    {
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '320',
+    },
+)
+
 class YouTubeExtractor:
     def __init__(self, cookies_file=None):
         self.cookies_file = cookies_file
         self.secret_key = "yttmp3_secret_2024"  # Change this in production
-        self.session = requests.Session()
-        self.setup_session()
-    
-    def setup_session(self):
-        """Setup requests session with proper headers"""
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-        })
+        self._signer = RequestSigner(self.secret_key)
+        # Option dicts are built once; only the cookies file and the rotating
+        # User-Agent are applied per pool build and per call
+        self._base_opts = {
+            **BASE_YTDLP_OPTS,
+            'http_headers': dict(BASE_HTTP_HEADERS),
+            'extractor_args': {'youtube': dict(BASE_EXTRACTOR_ARGS['youtube'])},
+        }
+        self._strategy_opts = {
+            strategy['name']: strategy['opts_modifier'](self._base_opts)
+            for strategy in self.get_strategies()
+        }
+        self._ydl_pool_lock = threading.Lock()
+        self._ydl_pool_cookies_mtime = self.get_cookies_mtime()
+        self._cookies_checked_at = time.monotonic()
+        self._ydl_pool = self.build_ydl_pool()
+        # Shared by every extraction instead of one executor per call
+        self._strategy_executor = ThreadPoolExecutor(
+            max_workers=STRATEGY_WORKERS,
+            thread_name_prefix='strategy'
+        )
     
     def generate_signature(self, video_id, format_type="mp3", timestamp=None):
         """Generate encrypted signature like competitor"""
@@ -53,18 +143,8 @@ class YouTubeExtractor:
             'r': random.random()
         }
         
-        # Create signature string
-        sig_string = f"{video_id}|{format_type}|{timestamp}|{data['r']}"
-        
-        # Generate HMAC signature
-        signature = hmac.new(
-            self.secret_key.encode(),
-            sig_string.encode(),
-            hashlib.sha256
-        ).digest()
-        
-        # Base64 encode
-        encoded_sig = base64.b64encode(signature).decode()
+        # Generate keyed BLAKE2b signature
+        encoded_sig = self._signer.sign(video_id, format_type, timestamp, data['r'])
         
         return {
             'sig': encoded_sig,
@@ -74,90 +154,40 @@ class YouTubeExtractor:
     
     def verify_signature(self, sig, video_id, format_type, timestamp, random_val):
         """Verify signature (for internal use)"""
-        sig_string = f"{video_id}|{format_type}|{timestamp}|{random_val}"
-        expected_sig = hmac.new(
-            self.secret_key.encode(),
-            sig_string.encode(),
-            hashlib.sha256
-        ).digest()
-        expected_encoded = base64.b64encode(expected_sig).decode()
-        return hmac.compare_digest(sig, expected_encoded)
+        return self._signer.verify(sig, video_id, format_type, timestamp, random_val)
     
     def get_ytdlp_options(self, use_signature=True):
         """Get yt-dlp options with advanced evasion"""
         
-        # Rotate between multiple user agents
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) Gecko/20100101 Firefox/121.0'
-        ]
-        
-        opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'writeinfojson': False,
-            'writedescription': False,
-            'writesubtitles': False,
-            'writeautomaticsub': False,
-            'ignoreerrors': False,
-            'geo_bypass': True,
-            'http_headers': {
-                'User-Agent': random.choice(user_agents),
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'cross-site',
-                'Cache-Control': 'max-age=0',
-            },
-            # Advanced extractor arguments
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web'],
-                    'player_skip': ['webpage', 'configs'],
-                    'skip': ['hls', 'dash'],
-                    'lang': ['en'],
-                    'innertube_host': 'www.youtube.com',
-                    'innertube_key': None,  # Let yt-dlp auto-detect
-                }
-            },
-            # Retry configuration
-            'retries': 3,
-            'fragment_retries': 3,
-            'sleep_interval': random.uniform(0.5, 2.0),
-            'max_sleep_interval': 10,
-            'sleep_interval_subtitles': 1,
-            # Network configuration
-            'socket_timeout': 30,
-            'http_chunk_size': 10485760,
-            # Use cookies if available
-        }
+        opts = dict(self._base_opts)
+        # Only the nested dicts callers modify are copied; the rest is shared
+        opts['http_headers'] = {**self._base_opts['http_headers'], 'User-Agent': next_user_agent()}
+        opts['extractor_args'] = {'youtube': dict(self._base_opts['extractor_args']['youtube'])}
         
         # Add cookies if available
-        if self.cookies_file and self.cookies_file.exists() and self.cookies_file.stat().st_size > 100:
-            opts['cookiefile'] = str(self.cookies_file)
+        cookiefile = self.get_cookiefile()
+        if cookiefile:
+            opts['cookiefile'] = cookiefile
             logger.info("Using cookies for extraction")
         
         return opts
     
-    def extract_video_info(self, url, use_fallbacks=True):
-        """Extract video info with multiple fallback strategies"""
-        
-        # Add random delay
-        time.sleep(random.uniform(0.1, 0.5))
-        
-        strategies = [
-            # Strategy 1: Standard web extraction with cookies
+    def get_cookiefile(self):
+        """Get the cookies file path for yt-dlp, or None if it is missing or empty"""
+        try:
+            if self.cookies_file and self.cookies_file.stat().st_size > 100:
+                return str(self.cookies_file)
+        except FileNotFoundError:
+            pass
+        return None
+    
+    def get_strategies(self):
+        """Get extraction strategies in fallback order"""
+        return [
+            # Strategy 1: Standard web extraction (cookies are added to every strategy)
             {
                 'name': 'web_with_cookies',
-                'opts_modifier': lambda opts: {**opts, 'cookiefile': str(self.cookies_file) if self.cookies_file and self.cookies_file.exists() else None}
+                'opts_modifier': lambda opts: {**opts}
             },
             # Strategy 2: Android client
             {
@@ -207,28 +237,151 @@ class YouTubeExtractor:
                 }
             }
         ]
+    
+    def build_ydl_pool(self):
+        """Build the per-strategy pools of idle YoutubeDL instances
         
-        for strategy in strategies:
-            try:
-                logger.info(f"Trying extraction strategy: {strategy['name']}")
-                
-                base_opts = self.get_ytdlp_options()
-                modified_opts = strategy['opts_modifier'](base_opts)
-                
-                with yt_dlp.YoutubeDL(modified_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    
-                    if info:
-                        logger.info(f"Successfully extracted info using {strategy['name']}")
-                        return info
-                    
-            except Exception as e:
-                logger.warning(f"Strategy {strategy['name']} failed: {str(e)[:200]}")
-                if not use_fallbacks:
-                    raise e
+        YoutubeDL is not safe for concurrent extract_info calls, so each call
+        checks an instance out of its strategy's pool and returns it when
+        done; new instances are only built when every pooled one is busy.
+        No lock is held across a call, so a slow extraction (like a race
+        loser still running) never blocks the next caller. yt-dlp's requests
+        transport keeps one keep-alive session per instance, so reused
+        instances also reuse their connections to youtube.com and
+        googlevideo.com.
+        """
+        cookiefile = self.get_cookiefile()
+        if cookiefile:
+            logger.info("Using cookies for extraction")
+        
+        pool = {}
+        for name, strategy_opts in self._strategy_opts.items():
+            opts = {**strategy_opts, 'http_headers': dict(strategy_opts['http_headers'])}
+            # Strategies without their own client User-Agent rotate browser ones
+            rotate_user_agent = 'User-Agent' not in opts['http_headers']
+            if rotate_user_agent:
+                opts['http_headers']['User-Agent'] = next_user_agent()
+            if cookiefile:
+                opts['cookiefile'] = cookiefile
+            idle = queue.SimpleQueue()
+            idle.put(self.new_ydl(opts))
+            pool[name] = (opts, idle, rotate_user_agent)
+        return pool
+    
+    def new_ydl(self, opts):
+        """Build a YoutubeDL instance from its own copy of opts
+        
+        YoutubeDL keeps the dict it is given as self.params, so instances
+        built from one dict would share params and headers, and rotating the
+        User-Agent on one would change it on all of them.
+        """
+        return yt_dlp.YoutubeDL({**opts, 'http_headers': dict(opts['http_headers'])})
+    
+    def get_cookies_mtime(self):
+        """Get the cookies file modification time, or None if it is missing"""
+        if not self.cookies_file:
+            return None
+        try:
+            return self.cookies_file.stat().st_mtime
+        except FileNotFoundError:
+            return None
+    
+    def get_ydl_pool(self):
+        """Get the strategy pool, rebuilding it if the cookies file changed
+        
+        YoutubeDL only reads its cookie jar at construction time, so pooled
+        instances would otherwise keep serving stale cookies. The file is
+        stat()ed at most every COOKIES_CHECK_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self._cookies_checked_at < COOKIES_CHECK_INTERVAL:
+            return self._ydl_pool
+        
+        self._cookies_checked_at = now
+        mtime = self.get_cookies_mtime()
+        if mtime != self._ydl_pool_cookies_mtime:
+            with self._ydl_pool_lock:
+                if mtime != self._ydl_pool_cookies_mtime:
+                    logger.info("Cookies file changed, rebuilding YoutubeDL pool")
+                    self._ydl_pool = self.build_ydl_pool()
+                    self._ydl_pool_cookies_mtime = mtime
+        return self._ydl_pool
+    
+    def try_strategy(self, pool, name, url, cancelled=None):
+        """Run a single extraction strategy on a checked-out YoutubeDL instance
+        
+        Returns None without extracting if cancelled is already set, e.g.
+        when another strategy won while this one was still queued.
+        """
+        if cancelled is not None and cancelled.is_set():
+            return None
+        
+        opts, idle, rotate_user_agent = pool[name]
+        try:
+            ydl = idle.get_nowait()
+        except queue.Empty:
+            ydl = self.new_ydl(opts)
+        
+        logger.info(f"Trying extraction strategy: {name}")
+        try:
+            if rotate_user_agent:
+                # yt-dlp copies these headers into every request it makes, so
+                # swapping the value rotates the User-Agent without a rebuild
+                ydl.params['http_headers']['User-Agent'] = next_user_agent()
+            return ydl.extract_info(url, download=False)
+        finally:
+            idle.put(ydl)
+    
+    def race_strategies(self, pool, names, url):
+        """Run strategies in parallel and return the first successful info, or None"""
+        cancelled = threading.Event()
+        futures = {
+            self._strategy_executor.submit(self.try_strategy, pool, name, url, cancelled): name
+            for name in names
+        }
+        try:
+            for future in as_completed(futures, timeout=STRATEGY_TIMEOUT):
+                name = futures[future]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    logger.warning(f"Strategy {name} failed: {str(e)[:200]}")
+                    continue
                 
-                # Add delay between strategies
-                time.sleep(random.uniform(0.5, 1.5))
+                if info:
+                    logger.info(f"Successfully extracted info using {name}")
+                    return info
+        except FuturesTimeoutError:
+            logger.warning(f"Strategies {', '.join(names)} timed out")
+        finally:
+            # Queued losers are dropped; running ones finish in the background
+            # on their own instance and hold nothing other callers need
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+        return None
+    
+    def extract_video_info(self, url, use_fallbacks=True):
+        """Extract video info with multiple fallback strategies
+        
+        Strategies are raced PARALLEL_STRATEGIES at a time and the first
+        successful result wins; the next group is only started if every
+        strategy in the current one fails.
+        """
+        
+        pool = self.get_ydl_pool()
+        names = list(pool)
+        
+        if not use_fallbacks:
+            info = self.try_strategy(pool, names[0], url)
+            if info:
+                return info
+            raise Exception("All extraction strategies failed")
+        
+        for start in range(0, len(names), PARALLEL_STRATEGIES):
+            info = self.race_strategies(pool, names[start:start + PARALLEL_STRATEGIES], url)
+            if info:
+                return info
         
         raise Exception("All extraction strategies failed")
     
@@ -241,18 +394,11 @@ class YouTubeExtractor:
         
         logger.info(f"Starting download with signature: {sig_data['sig'][:20]}...")
         
-        # Add random delay
-        time.sleep(random.uniform(0.2, 0.8))
-        
         opts = self.get_ytdlp_options()
         opts.update({
             'outtmpl': output_path,
             'format': 'bestaudio[ext=m4a]/bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': format_type,
-                'preferredquality': '320',
-            }] if format_type == 'mp3' else []
+            'postprocessors': list(MP3_POSTPROCESSORS) if format_type == 'mp3' else []
         })
         
         # Use the most reliable client for downloads
@@ -265,19 +411,12 @@ class YouTubeExtractor:
     
     def extract_video_id(self, url):
         """Extract video ID from YouTube URL"""
-        import re
-        
-        patterns = [
-            r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-            r'(?:embed\/)([0-9A-Za-z_-]{11})',
-            r'(?:watch\?v=)([0-9A-Za-z_-]{11})',
-            r'(?:shorts\/)([0-9A-Za-z_-]{11})',
-        ]
+        if len(url) > MAX_URL_LENGTH:
+            raise ValueError("URL is too long")
         
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
+        match = VIDEO_ID_RE.search(url)
+        if match:
+            return match.group(1)
         
         raise ValueError(f"Could not extract video ID from URL: {url}")
 